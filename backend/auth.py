@@ -0,0 +1,90 @@
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import hashlib
+import hmac
+import json
+import time
+import warnings
+import jwt
+from jwt.utils import base64url_encode
+import bcrypt
+from cachetools import TTLCache
+
+load_dotenv(Path(__file__).parent / '.env')
+
+JWT_SECRET = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
+_JWT_SECRET_BYTES = JWT_SECRET.encode('utf-8')
+# Shared decoder so per-call option merging is skipped; every token we issue carries exp
+_jwt_decoder = jwt.PyJWT(options={"require": ["exp"]})
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # Lower (e.g. 10) for dev/test
+# Opt-in worker processes for bcrypt; spawning them isn't worth it on small deployments
+_bcrypt_pool = ProcessPoolExecutor(max_workers=os.cpu_count()) if os.getenv("BCRYPT_PROCESS_POOL", "false").lower() == "true" else None
+
+# Decoded JWT payloads keyed by token digest (only successful decodes are cached)
+_jwt_cache = TTLCache(maxsize=10000, ttl=30)
+# Authenticated users keyed by id; the TTL bounds how long role/status changes take to apply
+user_cache = TTLCache(maxsize=5000, ttl=60)
+
+# Shared auth failures; with_traceback(None) keeps tracebacks from piling up across raises
+TOKEN_EXPIRED = HTTPException(status_code=401, detail="Token has expired")
+INVALID_TOKEN = HTTPException(status_code=401, detail="Invalid token")
+
+# Password hashing
+def _bcrypt_hash(password: bytes, rounds: int) -> bytes:
+    # Module-level so it can be pickled into _bcrypt_pool workers
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+async def hash_password(password: str) -> str:
+    # bcrypt is deliberately slow; keep it off the event loop
+    loop = asyncio.get_running_loop()
+    hashed = await loop.run_in_executor(_bcrypt_pool, _bcrypt_hash, password.encode('utf-8'), BCRYPT_ROUNDS)
+    return hashed.decode('utf-8')
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_pool, bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def shutdown_bcrypt_pool():
+    if _bcrypt_pool:
+        _bcrypt_pool.shutdown()
+
+# JWT
+# Pre-encoded HS256 header and pre-keyed HMAC; copying the HMAC skips the key schedule per token
+_JWT_HEADER_SEGMENT = base64url_encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode('utf-8'))
+_JWT_HMAC = hmac.new(_JWT_SECRET_BYTES, digestmod=hashlib.sha256)
+
+def encode_jwt(payload: dict) -> str:
+    payload_segment = base64url_encode(json.dumps(payload, separators=(",", ":")).encode('utf-8'))
+    signing_input = _JWT_HEADER_SEGMENT + b"." + payload_segment
+    signer = _JWT_HMAC.copy()
+    signer.update(signing_input)
+    return (signing_input + b"." + base64url_encode(signer.digest())).decode('utf-8')
+
+# The hand-rolled signer must produce exactly what PyJWT would; fail at import if it drifts
+_PARITY_PAYLOAD = {"user_id": "parity", "role": "user", "exp": 1700000000.5}
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")  # PyJWT warns about short dev secrets on encode
+    _pyjwt_token = jwt.encode(_PARITY_PAYLOAD, _JWT_SECRET_BYTES, algorithm="HS256")
+if encode_jwt(_PARITY_PAYLOAD) != _pyjwt_token:
+    raise RuntimeError("encode_jwt output differs from jwt.encode")
+
+def verify_jwt_token(token: str) -> dict:
+    cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _jwt_cache.get(cache_key)
+    # Never serve a cached payload past its own expiry
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+
+    try:
+        payload = _jwt_decoder.decode(token, _JWT_SECRET_BYTES, algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        raise TOKEN_EXPIRED.with_traceback(None)
+    except jwt.InvalidTokenError:
+        raise INVALID_TOKEN.with_traceback(None)
+
+    _jwt_cache[cache_key] = payload
+    return payload
@@ -1,20 +1,42 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, DateTime, Boolean, Text, Integer
+from sqlalchemy import String, DateTime, Boolean, Text, Integer, Index, event
 from datetime import datetime, timezone
 import os
+import logging
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./mimarlik_portal.db")
 
+# Keep per-statement SQL formatting out of the request path even if the root logger is at INFO
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
 # Create async engine
 engine = create_async_engine(
     DATABASE_URL,
-    echo=True,  # Set to False in production
+    echo=False,
+    # Room for every compiled statement shape the API uses (default is 500)
+    query_cache_size=1200,
+    pool_size=20,
+    max_overflow=10,
+    pool_recycle=3600,
+    # Local SQLite files never drop connections; only ping networked databases
+    pool_pre_ping=not DATABASE_URL.startswith("sqlite"),
 )
 
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside a writer; the rest trade durability/memory for speed
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-64000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 # Create session factory
 async_session_maker = async_sessionmaker(
     engine, 
@@ -54,14 +76,18 @@ class Course(Base):
     duration: Mapped[str] = mapped_column(String(50))
     image_url: Mapped[str] = mapped_column(String(500), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
-    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True, index=True)
 
 class Purchase(Base):
     __tablename__ = "purchases"
+    __table_args__ = (
+        # One purchase per user and course; also serves the ownership lookups
+        Index("ix_purchase_user_course", "user_id", "course_id", unique=True),
+    )
     
     id: Mapped[str] = mapped_column(String, primary_key=True)
     user_id: Mapped[str] = mapped_column(String)
-    course_id: Mapped[str] = mapped_column(String)
+    course_id: Mapped[str] = mapped_column(String, index=True)
     purchase_date: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     amount: Mapped[int] = mapped_column(Integer, default=0)
 
@@ -74,6 +100,13 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 # Initialize database
+def _create_indexes(conn):
+    # create_all skips tables that already exist, so add indexes declared later explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_indexes)
@@ -2,24 +2,33 @@ from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import functools
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 import uuid
+import time
 from datetime import datetime, timezone
-import jwt
-import bcrypt
+
+from auth import (INVALID_TOKEN, encode_jwt, hash_password, shutdown_bcrypt_pool, user_cache,
+                  verify_jwt_token, verify_password)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection, opened on first use so importing this module does no IO
+@functools.lru_cache(maxsize=None)
+def get_mongo_client():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(os.environ['MONGO_URL'])
+
+# Dependency to get the database handle; async so FastAPI doesn't hop to its threadpool per request
+async def get_db():
+    return get_mongo_client()[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -29,18 +38,10 @@ api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
-JWT_SECRET = "your-secret-key-here"  # In production, use environment variable
-
-# Helper function to hash passwords
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 # Models
 class User(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     first_name: str
     last_name: str
     gender: str
@@ -69,7 +70,7 @@ class UserLogin(BaseModel):
     password: str
 
 class Course(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     title: str
     description: str
     price: float
@@ -79,6 +80,9 @@ class Course(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     is_active: bool = True
 
+# Only the fields Course needs, so Mongo doesn't ship anything else back
+COURSE_PROJECTION = {"_id": 0, **{field: 1 for field in Course.model_fields}}
+
 class CourseCreate(BaseModel):
     title: str
     description: str
@@ -88,7 +92,7 @@ class CourseCreate(BaseModel):
     thumbnail_url: Optional[str] = None
 
 class Purchase(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     user_id: str
     course_id: str
     amount: float
@@ -102,25 +106,25 @@ class Token(BaseModel):
 
 # Auth helper functions
 def create_access_token(user_id: str):
-    payload = {"user_id": user_id, "exp": datetime.now(timezone.utc).timestamp() + 86400}
-    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
-
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=["HS256"])
-        user_id = payload.get("user_id")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id})
-        if not user:
+    payload = {"user_id": user_id, "exp": time.time() + 86400}
+    return encode_jwt(payload)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db=Depends(get_db)):
+    payload = verify_jwt_token(credentials.credentials)
+    user_id = payload.get("user_id")
+    if not user_id:
+        raise INVALID_TOKEN.with_traceback(None)
+    
+    user = user_cache.get(user_id)
+    if user is None:
+        user_doc = await db.users.find_one({"id": user_id})
+        if not user_doc:
             raise HTTPException(status_code=401, detail="User not found")
         
-        return User(**user)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        user = User(**user_doc)
+        user_cache[user_id] = user
+    
+    return user
 
 async def get_admin_user(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
@@ -129,14 +133,14 @@ async def get_admin_user(current_user: User = Depends(get_current_user)):
 
 # Authentication routes
 @api_router.post("/register", response_model=User)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, db=Depends(get_db)):
     # Check if user exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     
     # Create user
     user_dict = user_data.dict()
@@ -151,14 +155,14 @@ async def register(user_data: UserCreate):
     return user
 
 @api_router.post("/login", response_model=Token)
-async def login(login_data: UserLogin):
+async def login(login_data: UserLogin, db=Depends(get_db)):
     # Find user
     user_doc = await db.users.find_one({"email": login_data.email})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(login_data.password, user_doc['hashed_password']):
+    if not await verify_password(login_data.password, user_doc['hashed_password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create token
@@ -171,36 +175,37 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 
 # Course routes
 @api_router.get("/courses", response_model=List[Course])
-async def get_courses():
-    courses = await db.courses.find({"is_active": True}).to_list(1000)
+async def get_courses(db=Depends(get_db)):
+    courses = await db.courses.find({"is_active": True}, COURSE_PROJECTION).to_list(1000)
     return [Course(**course) for course in courses]
 
 @api_router.post("/admin/courses", response_model=Course)
-async def create_course(course_data: CourseCreate, admin_user: User = Depends(get_admin_user)):
+async def create_course(course_data: CourseCreate, admin_user: User = Depends(get_admin_user), db=Depends(get_db)):
     course = Course(**course_data.dict())
     course_doc = course.dict()
     await db.courses.insert_one(course_doc)
     return course
 
 @api_router.get("/admin/courses", response_model=List[Course])
-async def get_all_courses_admin(admin_user: User = Depends(get_admin_user)):
-    courses = await db.courses.find().to_list(1000)
+async def get_all_courses_admin(admin_user: User = Depends(get_admin_user), db=Depends(get_db)):
+    courses = await db.courses.find({}, COURSE_PROJECTION).to_list(1000)
     return [Course(**course) for course in courses]
 
 @api_router.put("/admin/courses/{course_id}", response_model=Course)
-async def update_course(course_id: str, course_data: CourseCreate, admin_user: User = Depends(get_admin_user)):
-    course_doc = await db.courses.find_one({"id": course_id})
-    if not course_doc:
-        raise HTTPException(status_code=404, detail="Course not found")
-    
+async def update_course(course_id: str, course_data: CourseCreate, admin_user: User = Depends(get_admin_user), db=Depends(get_db)):
     update_data = course_data.dict()
-    await db.courses.update_one({"id": course_id}, {"$set": update_data})
+    updated_course = await db.courses.find_one_and_update(
+        {"id": course_id},
+        {"$set": update_data},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_course:
+        raise HTTPException(status_code=404, detail="Course not found")
     
-    updated_course = await db.courses.find_one({"id": course_id})
     return Course(**updated_course)
 
 @api_router.delete("/admin/courses/{course_id}")
-async def delete_course(course_id: str, admin_user: User = Depends(get_admin_user)):
+async def delete_course(course_id: str, admin_user: User = Depends(get_admin_user), db=Depends(get_db)):
     result = await db.courses.delete_one({"id": course_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -208,17 +213,12 @@ async def delete_course(course_id: str, admin_user: User = Depends(get_admin_use
 
 # Purchase routes (Mock for prototype)
 @api_router.post("/purchase/{course_id}", response_model=Purchase)
-async def purchase_course(course_id: str, current_user: User = Depends(get_current_user)):
+async def purchase_course(course_id: str, current_user: User = Depends(get_current_user), db=Depends(get_db)):
     # Check if course exists
     course = await db.courses.find_one({"id": course_id, "is_active": True})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    # Check if already purchased
-    existing_purchase = await db.purchases.find_one({"user_id": current_user.id, "course_id": course_id})
-    if existing_purchase:
-        raise HTTPException(status_code=400, detail="Course already purchased")
-    
     # Create purchase (mock - always successful for free courses, or paid courses in prototype)
     purchase = Purchase(
         user_id=current_user.id,
@@ -229,25 +229,29 @@ async def purchase_course(course_id: str, current_user: User = Depends(get_curre
     )
     
     purchase_doc = purchase.dict()
-    await db.purchases.insert_one(purchase_doc)
+    try:
+        await db.purchases.insert_one(purchase_doc)
+    except DuplicateKeyError:
+        # The unique (user_id, course_id) index rejects a second purchase
+        raise HTTPException(status_code=400, detail="Course already purchased")
     
     return purchase
 
 @api_router.get("/my-courses", response_model=List[Course])
-async def get_my_courses(current_user: User = Depends(get_current_user)):
-    # Get purchased course IDs
-    purchases = await db.purchases.find({"user_id": current_user.id, "status": "completed"}).to_list(1000)
-    course_ids = [purchase['course_id'] for purchase in purchases]
-    
-    if not course_ids:
-        return []
-    
-    # Get courses
-    courses = await db.courses.find({"id": {"$in": course_ids}, "is_active": True}).to_list(1000)
+async def get_my_courses(current_user: User = Depends(get_current_user), db=Depends(get_db)):
+    # Join purchases to their courses in a single round trip
+    courses = await db.purchases.aggregate([
+        {"$match": {"user_id": current_user.id, "status": "completed"}},
+        {"$lookup": {"from": "courses", "localField": "course_id", "foreignField": "id", "as": "course"}},
+        {"$unwind": "$course"},
+        {"$match": {"course.is_active": True}},
+        {"$replaceRoot": {"newRoot": "$course"}},
+        {"$project": COURSE_PROJECTION}
+    ]).to_list(1000)
     return [Course(**course) for course in courses]
 
 @api_router.get("/course/{course_id}", response_model=Course)
-async def get_course_detail(course_id: str, current_user: User = Depends(get_current_user)):
+async def get_course_detail(course_id: str, current_user: User = Depends(get_current_user), db=Depends(get_db)):
     # Check if user purchased the course
     purchase = await db.purchases.find_one({"user_id": current_user.id, "course_id": course_id, "status": "completed"})
     if not purchase:
@@ -279,27 +283,44 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    # Only close a client that was actually opened
+    if get_mongo_client.cache_info().currsize:
+        get_mongo_client().close()
+    shutdown_bcrypt_pool()
+
+@app.on_event("startup")
+async def create_indexes():
+    db = await get_db()
+    await db.users.create_index("id", unique=True)
+    await db.users.create_index("email", unique=True)
+    await db.courses.create_index("id", unique=True)
+    await db.courses.create_index("is_active")
+    await db.purchases.create_index([("user_id", 1), ("course_id", 1)], unique=True)
+    await db.purchases.create_index([("user_id", 1), ("status", 1)])
 
 # Create admin user on startup
 @app.on_event("startup")
 async def create_admin():
-    admin_exists = await db.users.find_one({"email": "admin@mimarim.com"})
-    if not admin_exists:
-        admin_data = {
-            "id": str(uuid.uuid4()),
-            "first_name": "Admin",
-            "last_name": "User",
-            "gender": "other",
-            "email": "admin@mimarim.com",
-            "phone": "+90 555 123 4567",
-            "birth_date": "1990-01-01",
-            "country": "Turkey",
-            "city": "Istanbul",
-            "role": "admin",
-            "hashed_password": hash_password("admin123"),
-            "created_at": datetime.now(timezone.utc),
-            "is_active": True
-        }
-        await db.users.insert_one(admin_data)
+    db = await get_db()
+    admin_data = {
+        "id": uuid.uuid4().hex,
+        "first_name": "Admin",
+        "last_name": "User",
+        "gender": "other",
+        "phone": "+90 555 123 4567",
+        "birth_date": "1990-01-01",
+        "country": "Turkey",
+        "city": "Istanbul",
+        "role": "admin",
+        "hashed_password": await hash_password("admin123"),
+        "created_at": datetime.now(timezone.utc),
+        "is_active": True
+    }
+    # Upsert keyed on email: one round trip, and safe when several workers start at once
+    result = await db.users.update_one(
+        {"email": "admin@mimarim.com"},
+        {"$setOnInsert": admin_data},
+        upsert=True
+    )
+    if result.upserted_id is not None:
         logger.info("Admin user created: admin@mimarim.com / admin123")
\ No newline at end of file
@@ -3,19 +3,20 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-import os
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from typing import List, Optional
 import uuid
+import time
 from datetime import datetime, timezone
-import jwt
-import bcrypt
 
 # Import our database models
-from database import get_db, init_db, User, Course, Purchase, async_session_maker
+from database import get_db, init_db, engine, User, Course, Purchase, async_session_maker
+from auth import encode_jwt, hash_password, shutdown_bcrypt_pool, user_cache, verify_jwt_token, verify_password
 
 # Load environment variables
 load_dotenv()
@@ -43,7 +44,6 @@ logger = logging.getLogger(__name__)
 
 # Security
 security = HTTPBearer()
-JWT_SECRET = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -61,6 +61,8 @@ class UserLogin(BaseModel):
     password: str
 
 class UserResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: str
     name: str
     surname: str
@@ -84,6 +86,8 @@ class CourseCreate(BaseModel):
     image_url: Optional[str] = None
 
 class CourseResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
     id: str
     title: str
     description: str
@@ -96,42 +100,46 @@ class CourseResponse(BaseModel):
     created_at: datetime
     is_active: bool
 
-# Utility functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# Columns backing CourseResponse; list endpoints load these as plain rows instead of ORM entities
+COURSE_RESPONSE_COLUMNS = [getattr(Course, field) for field in CourseResponse.model_fields]
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+# Utility functions
+def utcnow() -> datetime:
+    # SQLite keeps no UTC offset and reads DateTime columns back naive; write the same
+    # naive UTC so a freshly created row serializes like one loaded from the database
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 def create_jwt_token(user_id: str, email: str, role: str) -> str:
     payload = {
         "user_id": user_id,
         "email": email,
         "role": role,
-        "exp": datetime.utcnow().timestamp() + 86400  # 24 hours
+        "exp": time.time() + 86400  # 24 hours
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
-
-def verify_jwt_token(token: str) -> dict:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    return encode_jwt(payload)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)):
     payload = verify_jwt_token(credentials.credentials)
     user_id = payload.get("user_id")
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
+    user = user_cache.get(user_id)
+    if user is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        
+        # Detach so the cached instance outlives this request's session
+        db.expunge(user)
+        user_cache[user_id] = user
     return user
 
+async def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
@@ -139,28 +147,48 @@ async def startup_event():
     # Create admin user if not exists
     await create_admin_user()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    shutdown_bcrypt_pool()
+
+# Dialects whose INSERT supports ON CONFLICT DO NOTHING
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
 async def create_admin_user():
+    admin_values = dict(
+        id=uuid.uuid4().hex,
+        name="Admin",
+        surname="User",
+        email="admin@mimarim.com",
+        phone="+90 555 123 4567",
+        birth_date="1990-01-01",
+        country="Turkey",
+        city="Istanbul",
+        role="admin",
+        hashed_password=await hash_password("admin123"),
+        created_at=utcnow(),
+        is_active=True
+    )
+    upsert_insert = UPSERT_INSERTS.get(engine.dialect.name)
     async with async_session_maker() as db:
-        result = await db.execute(select(User).where(User.email == "admin@mimarim.com"))
-        admin_exists = result.scalar_one_or_none()
-        
-        if not admin_exists:
-            admin_data = User(
-                id=str(uuid.uuid4()),
-                name="Admin",
-                surname="User",
-                email="admin@mimarim.com",
-                phone="+90 555 123 4567",
-                birth_date="1990-01-01",
-                country="Turkey",
-                city="Istanbul",
-                role="admin",
-                hashed_password=hash_password("admin123"),
-                created_at=datetime.now(timezone.utc),
-                is_active=True
+        if upsert_insert:
+            # Single idempotent insert, so concurrently starting workers can't race each other
+            result = await db.execute(
+                upsert_insert(User).values(**admin_values).on_conflict_do_nothing(index_elements=[User.email])
             )
-            db.add(admin_data)
             await db.commit()
+            created = bool(result.rowcount)
+        else:
+            # No ON CONFLICT here; the unique email index rejects a second admin instead
+            db.add(User(**admin_values))
+            try:
+                await db.commit()
+                created = True
+            except IntegrityError:
+                await db.rollback()
+                created = False
+        
+        if created:
             logger.info("Admin user created: admin@mimarim.com / admin123")
 
 # Routes
@@ -184,7 +212,7 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     
     # Create new user
     new_user = User(
-        id=str(uuid.uuid4()),
+        id=uuid.uuid4().hex,
         name=user_data.name,
         surname=user_data.surname,
         email=user_data.email,
@@ -193,35 +221,22 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
         country=user_data.country,
         city=user_data.city,
         role="user",
-        hashed_password=hash_password(user_data.password),
-        created_at=datetime.now(timezone.utc),
+        hashed_password=await hash_password(user_data.password),
+        created_at=utcnow(),
         is_active=True
     )
     
     db.add(new_user)
     await db.commit()
-    await db.refresh(new_user)
     
-    return UserResponse(
-        id=new_user.id,
-        name=new_user.name,
-        surname=new_user.surname,
-        email=new_user.email,
-        phone=new_user.phone,
-        birth_date=new_user.birth_date,
-        country=new_user.country,
-        city=new_user.city,
-        role=new_user.role,
-        created_at=new_user.created_at,
-        is_active=new_user.is_active
-    )
+    return new_user
 
 @api_router.post("/login")
 async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).where(User.email == user_data.email))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    if not user or not await verify_password(user_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if not user.is_active:
@@ -232,56 +247,18 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     return {
         "access_token": token,
         "token_type": "bearer",
-        "user": UserResponse(
-            id=user.id,
-            name=user.name,
-            surname=user.surname,
-            email=user.email,
-            phone=user.phone,
-            birth_date=user.birth_date,
-            country=user.country,
-            city=user.city,
-            role=user.role,
-            created_at=user.created_at,
-            is_active=user.is_active
-        )
+        "user": UserResponse.model_validate(user)
     }
 
 @api_router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return UserResponse(
-        id=current_user.id,
-        name=current_user.name,
-        surname=current_user.surname,
-        email=current_user.email,
-        phone=current_user.phone,
-        birth_date=current_user.birth_date,
-        country=current_user.country,
-        city=current_user.city,
-        role=current_user.role,
-        created_at=current_user.created_at,
-        is_active=current_user.is_active
-    )
+    return current_user
 
 # Course routes
 @api_router.get("/courses", response_model=List[CourseResponse])
 async def get_courses(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Course).where(Course.is_active == True))
-    courses = result.scalars().all()
-    
-    return [CourseResponse(
-        id=course.id,
-        title=course.title,
-        description=course.description,
-        instructor=course.instructor,
-        price=course.price,
-        category=course.category,
-        difficulty=course.difficulty,
-        duration=course.duration,
-        image_url=course.image_url,
-        created_at=course.created_at,
-        is_active=course.is_active
-    ) for course in courses]
+    result = await db.execute(select(*COURSE_RESPONSE_COLUMNS).where(Course.is_active == True))
+    return result.all()
 
 @api_router.get("/course/{course_id}", response_model=CourseResponse)
 async def get_course_detail(course_id: str, db: AsyncSession = Depends(get_db)):
@@ -291,19 +268,7 @@ async def get_course_detail(course_id: str, db: AsyncSession = Depends(get_db)):
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    return CourseResponse(
-        id=course.id,
-        title=course.title,
-        description=course.description,
-        instructor=course.instructor,
-        price=course.price,
-        category=course.category,
-        difficulty=course.difficulty,
-        duration=course.duration,
-        image_url=course.image_url,
-        created_at=course.created_at,
-        is_active=course.is_active
-    )
+    return course
 
 @api_router.post("/purchase/{course_id}")
 async def purchase_course(
@@ -318,24 +283,22 @@ async def purchase_course(
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    # Check if already purchased
-    result = await db.execute(select(Purchase).where(Purchase.user_id == current_user.id, Purchase.course_id == course_id))
-    existing_purchase = result.scalar_one_or_none()
-    
-    if existing_purchase:
-        raise HTTPException(status_code=400, detail="Course already purchased")
-    
     # Create purchase record
     new_purchase = Purchase(
-        id=str(uuid.uuid4()),
+        id=uuid.uuid4().hex,
         user_id=current_user.id,
         course_id=course_id,
-        purchase_date=datetime.now(timezone.utc),
+        purchase_date=utcnow(),
         amount=course.price
     )
     
     db.add(new_purchase)
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # ix_purchase_user_course rejects a second purchase of the same course
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Course already purchased")
     
     return {"message": "Course purchased successfully", "purchase_id": new_purchase.id}
 
@@ -343,59 +306,25 @@ async def purchase_course(
 async def get_my_courses(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     # Get purchased courses
     result = await db.execute(
-        select(Course).join(Purchase, Course.id == Purchase.course_id)
+        select(*COURSE_RESPONSE_COLUMNS).join(Purchase, Course.id == Purchase.course_id)
         .where(Purchase.user_id == current_user.id, Course.is_active == True)
     )
-    courses = result.scalars().all()
-    
-    return [CourseResponse(
-        id=course.id,
-        title=course.title,
-        description=course.description,
-        instructor=course.instructor,
-        price=course.price,
-        category=course.category,
-        difficulty=course.difficulty,
-        duration=course.duration,
-        image_url=course.image_url,
-        created_at=course.created_at,
-        is_active=course.is_active
-    ) for course in courses]
+    return result.all()
 
 # Admin routes
 @api_router.get("/admin/courses", response_model=List[CourseResponse])
-async def get_admin_courses(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can access this endpoint")
-    
-    result = await db.execute(select(Course))
-    courses = result.scalars().all()
-    
-    return [CourseResponse(
-        id=course.id,
-        title=course.title,
-        description=course.description,
-        instructor=course.instructor,
-        price=course.price,
-        category=course.category,
-        difficulty=course.difficulty,
-        duration=course.duration,
-        image_url=course.image_url,
-        created_at=course.created_at,
-        is_active=course.is_active
-    ) for course in courses]
+async def get_admin_courses(admin_user: User = Depends(get_admin_user), db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(*COURSE_RESPONSE_COLUMNS))
+    return result.all()
 
 @api_router.post("/admin/courses", response_model=CourseResponse)
 async def create_admin_course(
     course_data: CourseCreate, 
-    current_user: User = Depends(get_current_user),
+    admin_user: User = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can create courses")
-    
     new_course = Course(
-        id=str(uuid.uuid4()),
+        id=uuid.uuid4().hex,
         title=course_data.title,
         description=course_data.description,
         instructor=course_data.instructor,
@@ -404,80 +333,44 @@ async def create_admin_course(
         difficulty=course_data.difficulty,
         duration=course_data.duration,
         image_url=course_data.image_url,
-        created_at=datetime.now(timezone.utc),
+        created_at=utcnow(),
         is_active=True
     )
     
     db.add(new_course)
     await db.commit()
-    await db.refresh(new_course)
     
-    return CourseResponse(
-        id=new_course.id,
-        title=new_course.title,
-        description=new_course.description,
-        instructor=new_course.instructor,
-        price=new_course.price,
-        category=new_course.category,
-        difficulty=new_course.difficulty,
-        duration=new_course.duration,
-        image_url=new_course.image_url,
-        created_at=new_course.created_at,
-        is_active=new_course.is_active
-    )
+    return new_course
 
 @api_router.put("/admin/courses/{course_id}", response_model=CourseResponse)
 async def update_course(
     course_id: str,
     course_data: CourseCreate,
-    current_user: User = Depends(get_current_user),
+    admin_user: User = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can update courses")
-    
-    result = await db.execute(select(Course).where(Course.id == course_id))
+    # Update and read back the course in a single statement
+    result = await db.execute(
+        update(Course)
+        .where(Course.id == course_id)
+        .values(**course_data.model_dump())
+        .returning(Course)
+    )
     course = result.scalar_one_or_none()
     
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
     
-    # Update course fields
-    course.title = course_data.title
-    course.description = course_data.description
-    course.instructor = course_data.instructor
-    course.price = course_data.price
-    course.category = course_data.category
-    course.difficulty = course_data.difficulty
-    course.duration = course_data.duration
-    course.image_url = course_data.image_url
-    
     await db.commit()
-    await db.refresh(course)
     
-    return CourseResponse(
-        id=course.id,
-        title=course.title,
-        description=course.description,
-        instructor=course.instructor,
-        price=course.price,
-        category=course.category,
-        difficulty=course.difficulty,
-        duration=course.duration,
-        image_url=course.image_url,
-        created_at=course.created_at,
-        is_active=course.is_active
-    )
+    return course
 
 @api_router.delete("/admin/courses/{course_id}")
 async def delete_course(
     course_id: str,
-    current_user: User = Depends(get_current_user),
+    admin_user: User = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    if current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can delete courses")
-    
     result = await db.execute(select(Course).where(Course.id == course_id))
     course = result.scalar_one_or_none()
     
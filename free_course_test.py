@@ -4,22 +4,29 @@ Test Free Course Functionality for Mimar Portal
 Tests the new free course features (price = 0)
 """
 
-import requests
 import sys
-import json
-from datetime import datetime
+import time
 
-class FreeCourseAPITester:
-    def __init__(self, base_url="https://mimarim-portal.preview.emergentagent.com/api"):
-        self.base_url = base_url
-        self.admin_token = None
-        self.user_token = None
-        self.free_course_id = None
-        self.tests_run = 0
-        self.tests_passed = 0
+from backend_test import DEFAULT_BASE_URL, MimarPortalAPITester
+
+class FreeCourseAPITester(MimarPortalAPITester):
+    START_BANNER = "🆓 Starting Free Course Feature Tests"
+    SUMMARY_TITLE = "📊 FREE COURSE TEST RESULTS"
+    SUCCESS_MESSAGE = "🎉 All free course tests passed!"
+
+    TEST_GRAPH = {
+        **MimarPortalAPITester.TEST_GRAPH,
+        'test_create_free_course': ('admin_token',),
+        'test_purchase_free_course': ('user_token', 'test_course_id'),
+        'test_access_free_course': ('user_token', 'test_course_id'),
+        'test_free_course_in_my_courses': ('user_token',),
+    }
+
+    def __init__(self, base_url=DEFAULT_BASE_URL):
+        super().__init__(base_url)
         
         # Generate unique test data
-        timestamp = datetime.now().strftime('%H%M%S')
+        timestamp = f"{time.time_ns():x}"
         self.test_user_data = {
             "first_name": "Free",
             "last_name": "User",
@@ -51,259 +58,117 @@ class FreeCourseAPITester:
                 }
             ]
         }
-
-    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None):
-        """Run a single API test"""
-        url = f"{self.base_url}/{endpoint}"
-        test_headers = {'Content-Type': 'application/json'}
-        if headers:
-            test_headers.update(headers)
-
-        self.tests_run += 1
-        print(f"\n🔍 Testing {name}...")
-        
-        try:
-            if method == 'GET':
-                response = requests.get(url, headers=test_headers, timeout=30)
-            elif method == 'POST':
-                response = requests.post(url, json=data, headers=test_headers, timeout=30)
-
-            success = response.status_code == expected_status
-            if success:
-                self.tests_passed += 1
-                print(f"✅ PASSED - Status: {response.status_code}")
-                try:
-                    response_data = response.json()
-                    return True, response_data
-                except:
-                    return True, {}
-            else:
-                print(f"❌ FAILED - Expected {expected_status}, got {response.status_code}")
-                try:
-                    error_data = response.json()
-                    print(f"   Error: {error_data}")
-                except:
-                    print(f"   Error: {response.text}")
-                return False, {}
-
-        except Exception as e:
-            print(f"❌ FAILED - Error: {str(e)}")
-            return False, {}
-
-    def test_admin_login(self):
-        """Login as admin"""
-        admin_data = {
-            "email": "admin@mimarim.com",
-            "password": "admin123"
-        }
-        success, response = self.run_test(
-            "Admin Login",
-            "POST",
-            "login",
-            200,
-            data=admin_data
-        )
-        if success and 'access_token' in response:
-            self.admin_token = response['access_token']
-        return success
+        self.test_course_data = self.free_course_data
+        self._serialize_payloads()
 
     def test_user_registration_and_login(self):
         """Register and login test user"""
-        # Register
-        success1, _ = self.run_test(
-            "Free User Registration",
-            "POST",
-            "register",
-            200,
-            data=self.test_user_data
-        )
-        
-        if not success1:
-            return False
-            
-        # Login
-        login_data = {
-            "email": self.test_user_data["email"],
-            "password": self.test_user_data["password"]
-        }
-        success2, response = self.run_test(
-            "Free User Login",
-            "POST",
-            "login",
-            200,
-            data=login_data
-        )
-        if success2 and 'access_token' in response:
-            self.user_token = response['access_token']
-        
-        return success1 and success2
+        return self.test_user_registration() and self.test_user_login()
 
     def test_create_free_course(self):
         """Create a free course (price = 0)"""
-        if not self.admin_token:
-            print("❌ SKIPPED - No admin token")
-            return False
-            
-        headers = {'Authorization': f'Bearer {self.admin_token}'}
         success, response = self.run_test(
             "Create Free Course (Price = 0)",
             "POST",
             "admin/courses",
             200,
-            data=self.free_course_data,
-            headers=headers
+            data_bytes=self._course_payload,
+            headers=self.admin_auth_headers
         )
         
         if success and 'id' in response:
-            self.free_course_id = response['id']
-            print(f"   Free Course ID: {self.free_course_id}")
-            print(f"   Course Price: {response.get('price', 'N/A')}")
+            self.test_course_id = response['id']
+            self._detail(f"   Free Course ID: {self.test_course_id}")
+            self._detail(f"   Course Price: {response.get('price', 'N/A')}")
             
             # Verify it's actually free
             if response.get('price') == 0:
-                print(f"   ✅ Confirmed: Course is FREE (price = 0)")
+                self._detail(f"   ✅ Confirmed: Course is FREE (price = 0)")
             else:
-                print(f"   ❌ Warning: Course price is not 0: {response.get('price')}")
+                self._log(f"   ❌ Warning: Course price is not 0: {response.get('price')}")
         
         return success
 
     def test_purchase_free_course(self):
         """Test purchasing a free course (should be auto-approved)"""
-        if not self.user_token or not self.free_course_id:
-            print("❌ SKIPPED - No user token or free course ID")
-            return False
-            
-        headers = {'Authorization': f'Bearer {self.user_token}'}
         success, response = self.run_test(
             "Purchase Free Course (Auto-approve)",
             "POST",
-            f"purchase/{self.free_course_id}",
+            f"purchase/{self.test_course_id}",
             200,
-            headers=headers
+            headers=self.user_auth_headers
         )
         
         if success:
-            print(f"   Purchase Amount: {response.get('amount', 'N/A')}")
-            print(f"   Purchase Status: {response.get('status', 'N/A')}")
+            self._detail(f"   Purchase Amount: {response.get('amount', 'N/A')}")
+            self._detail(f"   Purchase Status: {response.get('status', 'N/A')}")
             
             # Verify free course purchase
             if response.get('amount') == 0:
-                print(f"   ✅ Confirmed: Free course purchase (amount = 0)")
+                self._detail(f"   ✅ Confirmed: Free course purchase (amount = 0)")
             if response.get('status') == 'completed':
-                print(f"   ✅ Confirmed: Auto-approved (status = completed)")
+                self._detail(f"   ✅ Confirmed: Auto-approved (status = completed)")
         
         return success
 
     def test_access_free_course(self):
         """Test accessing the free course after purchase"""
-        if not self.user_token or not self.free_course_id:
-            print("❌ SKIPPED - No user token or free course ID")
-            return False
-            
-        headers = {'Authorization': f'Bearer {self.user_token}'}
         success, response = self.run_test(
             "Access Free Course Content",
             "GET",
-            f"course/{self.free_course_id}",
+            f"course/{self.test_course_id}",
             200,
-            headers=headers
+            headers=self.user_auth_headers
         )
         
         if success:
-            print(f"   Course Title: {response.get('title', 'N/A')}")
-            print(f"   Video Count: {len(response.get('videos', []))}")
-            print(f"   Course Price: {response.get('price', 'N/A')}")
+            self._detail(f"   Course Title: {response.get('title', 'N/A')}")
+            self._detail(f"   Video Count: {len(response.get('videos', []))}")
+            self._detail(f"   Course Price: {response.get('price', 'N/A')}")
         
         return success
 
     def test_free_course_in_my_courses(self):
         """Test that free course appears in user's courses"""
-        if not self.user_token:
-            print("❌ SKIPPED - No user token")
-            return False
-            
-        headers = {'Authorization': f'Bearer {self.user_token}'}
         success, response = self.run_test(
             "Free Course in My Courses",
             "GET",
             "my-courses",
             200,
-            headers=headers
+            headers=self.user_auth_headers
         )
         
         if success:
-            print(f"   Total Courses: {len(response)}")
-            free_courses = [c for c in response if c.get('price') == 0]
-            print(f"   Free Courses: {len(free_courses)}")
+            # One pass indexes the courses and counts the free ones
+            by_id, free_count = {}, 0
+            for course in response:
+                by_id[course.get('id')] = course
+                free_count += course.get('price') == 0
+            self._detail(f"   Total Courses: {len(response)}")
+            self._detail(f"   Free Courses: {free_count}")
             
-            if self.free_course_id:
-                found_course = next((c for c in response if c.get('id') == self.free_course_id), None)
-                if found_course:
-                    print(f"   ✅ Found our test free course in user's courses")
+            if self.test_course_id:
+                if self.test_course_id in by_id:
+                    self._detail(f"   ✅ Found our test free course in user's courses")
                 else:
-                    print(f"   ❌ Test free course not found in user's courses")
+                    self._log(f"   ❌ Test free course not found in user's courses")
         
         return success
 
-    def cleanup_free_course(self):
-        """Delete the test free course"""
-        if not self.admin_token or not self.free_course_id:
-            print("❌ SKIPPED - No admin token or free course ID")
-            return False
-            
-        headers = {'Authorization': f'Bearer {self.admin_token}'}
-        success, response = self.run_test(
-            "Delete Free Course (Cleanup)",
-            "DELETE",
-            f"admin/courses/{self.free_course_id}",
-            200,
-            headers=headers
-        )
-        return success
-
-    def run_all_tests(self):
-        """Run all free course tests"""
-        print("🆓 Starting Free Course Feature Tests")
-        print(f"📍 Base URL: {self.base_url}")
-        print("=" * 60)
-
-        test_results = []
-        
-        # Setup
-        test_results.append(("Admin Login", self.test_admin_login()))
-        test_results.append(("User Registration & Login", self.test_user_registration_and_login()))
-        
-        # Free course tests
-        test_results.append(("Create Free Course", self.test_create_free_course()))
-        test_results.append(("Purchase Free Course", self.test_purchase_free_course()))
-        test_results.append(("Access Free Course", self.test_access_free_course()))
-        test_results.append(("Free Course in My Courses", self.test_free_course_in_my_courses()))
-        
-        # Cleanup
-        test_results.append(("Cleanup Free Course", self.cleanup_free_course()))
-
-        # Print results
-        print("\n" + "=" * 60)
-        print("📊 FREE COURSE TEST RESULTS")
-        print("=" * 60)
-        
-        failed_tests = []
-        for test_name, result in test_results:
-            status = "✅ PASSED" if result else "❌ FAILED"
-            print(f"{status} - {test_name}")
-            if not result:
-                failed_tests.append(test_name)
-        
-        print(f"\n📈 Overall: {self.tests_passed}/{self.tests_run} tests passed")
-        
-        if failed_tests:
-            print(f"\n❌ Failed Tests:")
-            for test in failed_tests:
-                print(f"   - {test}")
-            return 1
-        else:
-            print(f"\n🎉 All free course tests passed!")
-            return 0
+    def run_test_sequence(self):
+        """Run the free course tests and return (name, passed) pairs"""
+        return self.run_levels([
+            # Setup (admin and user accounts are independent)
+            [[("Admin Login", self.test_admin_login),
+              ("Create Free Course", self.test_create_free_course)],
+             ("User Registration & Login", self.test_user_registration_and_login)],
+            # Free course tests
+            [("Purchase Free Course", self.test_purchase_free_course)],
+            [("Access Free Course", self.test_access_free_course),
+             ("Free Course in My Courses", self.test_free_course_in_my_courses)],
+            # Cleanup
+            [("Cleanup Free Course", self.test_delete_course_admin)],
+        ])
 
 def main():
     """Main test runner"""
@@ -311,4 +176,4 @@ def main():
     return tester.run_all_tests()
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
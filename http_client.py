@@ -0,0 +1,36 @@
+"""
+Shared HTTP session for the API test suites
+One keep-alive pool per process, so a suite run after another reuses its warm connections
+"""
+
+import atexit
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the process-wide session, building it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=20, pool_maxsize=40)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Content-Type': 'application/json'})
+                _session = session
+    return _session
+
+@atexit.register
+def close_session():
+    """Release the pooled connections"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None